@@ -4,30 +4,48 @@ Boot Keycloak: Complete Keycloak Setup and Configuration
 
 This script combines Docker management and Keycloak configuration into a single
 streamlined process. It will:
-1. Start Keycloak using Docker Compose
-2. Wait for Keycloak to be ready
+1. Start Keycloak using Docker Compose and wait for its healthcheck
+2. Verify Keycloak is reachable
 3. Configure Keycloak using setup_keycloak.py
 4. Verify the setup was successful
 
 Usage:
-    python boot_keycloak.py [--config CONFIG_FILE] [--url KEYCLOAK_URL] [--summary] [--verbose]
+    python boot_keycloak.py [--config CONFIG_FILE] [--url KEYCLOAK_URL] [--summary] [--verbose] [--force] [--isolated] [--batch]
 """
 
 import subprocess
 import sys
 import time
-import requests
+import random
 import json
+import logging
 import os
 import argparse
+import hashlib
+import importlib.util
+import pickle
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from collections import deque
+from typing import Deque, Dict, Any, Optional, List
 
 # Configuration
 DEFAULT_KEYCLOAK_URL = "http://localhost:8080"
 DEFAULT_CONFIG_FILE = "config.json"
 DEFAULT_ADMIN_USERNAME = "admin"
 DEFAULT_ADMIN_PASSWORD = "admin"
+BOOT_STATE_FILE = Path(__file__).parent / ".boot_state.json"
+CONFIG_CACHE_DIR = Path.home() / ".cache" / "boot_keycloak"
+# Seconds docker compose up --wait waits for the healthcheck. Keep in sync with the
+# keycloak-idp healthcheck in docker-compose.yml (start_period + retries * interval).
+COMPOSE_WAIT_TIMEOUT = 120
+
+# Shared HTTP session so health probes reuse a single keep-alive connection.
+# Created on first use by _get_session() so paths that never probe skip importing requests.
+_SESSION = None
+
+# Last successful health probe as (url, monotonic timestamp, healthy)
+_last_health = ("", 0.0, False)
+_HEALTH_TTL = 1.0
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -40,128 +58,297 @@ class Colors:
     WHITE = '\033[1;37m'
     NC = '\033[0m'  # No Color
 
-def log(message: str, level: str = "INFO", verbose: bool = False):
-    """Log messages with color coding."""
-    colors = {
-        'INFO': f'{Colors.BLUE}ℹ️{Colors.NC}',
-        'SUCCESS': f'{Colors.GREEN}✅{Colors.NC}',
-        'WARNING': f'{Colors.YELLOW}⚠️{Colors.NC}',
-        'ERROR': f'{Colors.RED}❌{Colors.NC}',
-        'VERBOSE': f'{Colors.CYAN}🔍{Colors.NC}'
+# Custom level between INFO and WARNING for the green check-mark messages
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LOG_LEVELS = {
+    'VERBOSE': logging.DEBUG,
+    'INFO': logging.INFO,
+    'SUCCESS': SUCCESS,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+logger = logging.getLogger("boot_keycloak")
+
+class ColorFormatter(logging.Formatter):
+    """Prefix each record with a colored icon for its level."""
+    PREFIXES = {
+        logging.DEBUG: f'{Colors.CYAN}🔍{Colors.NC}',
+        logging.INFO: f'{Colors.BLUE}ℹ️{Colors.NC}',
+        SUCCESS: f'{Colors.GREEN}✅{Colors.NC}',
+        logging.WARNING: f'{Colors.YELLOW}⚠️{Colors.NC}',
+        logging.ERROR: f'{Colors.RED}❌{Colors.NC}',
     }
     
-    if level == "VERBOSE" and not verbose:
-        return
+    def format(self, record: logging.LogRecord) -> str:
+        prefix = self.PREFIXES.get(record.levelno, self.PREFIXES[logging.INFO])
+        return f"{prefix} {record.getMessage()}"
+
+def configure_logging(verbose: bool = False) -> None:
+    """Send log records to stdout, including VERBOSE (debug) records when verbose is set."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(ColorFormatter())
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+def log(message: str, level: str = "INFO"):
+    """Log messages with color coding."""
+    logger.log(LOG_LEVELS.get(level, logging.INFO), message)
+
+def run_command(argv: List[str], cwd: Optional[Path] = None, check: bool = True,
+                capture: bool = False) -> subprocess.CompletedProcess:
+    """Run a command (without a shell), streaming its output as it is produced.
     
-    color = colors.get(level, colors['INFO'])
-    print(f"{color} {message}")
+    stderr is merged into stdout. Output is only kept in the returned result when
+    ``capture`` is set; otherwise just the last few lines are held for error reporting.
+    """
+    log(f"Running: {' '.join(argv)}")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    captured: Optional[List[str]] = [] if capture else None
+    tail: Deque[str] = deque(maxlen=20)
+    with subprocess.Popen(argv, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          bufsize=1, text=True) as proc:
+        for line in proc.stdout:
+            if debug:
+                logger.debug(line.rstrip())
+            tail.append(line)
+            if captured is not None:
+                captured.append(line)
+    
+    output = "".join(captured if captured is not None else tail)
+    result = subprocess.CompletedProcess(argv, proc.returncode, output, None)
+    if check and result.returncode != 0:
+        log(f"Command failed with exit code {result.returncode}", "ERROR")
+        if tail:
+            log(f"Error: {''.join(tail).strip()}", "ERROR")
+        raise subprocess.CalledProcessError(result.returncode, argv, output=output)
+    return result
 
-def run_command(command: str, cwd: Optional[Path] = None, check: bool = True, verbose: bool = False) -> subprocess.CompletedProcess:
-    """Run a shell command and return the result."""
-    log(f"Running: {command}", verbose=verbose)
-    try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            cwd=cwd,
-            capture_output=True,
-            text=True,
-            check=check
-        )
-        if result.stdout and verbose:
-            log(f"Output: {result.stdout.strip()}", "VERBOSE")
-        if result.stderr and verbose:
-            log(f"Stderr: {result.stderr.strip()}", "VERBOSE")
-        return result
-    except subprocess.CalledProcessError as e:
-        log(f"Command failed with exit code {e.returncode}", "ERROR")
-        if e.stderr:
-            log(f"Error: {e.stderr}", "ERROR")
-        if check:
-            raise
-        return e
+def _get_session():
+    """Return the shared health-check session, importing requests on first use."""
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        # Retries are disabled here because wait_for_keycloak already polls
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2, max_retries=Retry(total=0, connect=0, read=0))
+        _SESSION = requests.Session()
+        _SESSION.mount("http://", adapter)
+        _SESSION.mount("https://", adapter)
+    return _SESSION
 
 def check_keycloak_health(keycloak_url: str) -> bool:
-    """Check if Keycloak is healthy and responding."""
+    """Check if Keycloak is healthy and responding.
+    
+    A passing result is cached per URL for _HEALTH_TTL seconds so back-to-back callers
+    don't each pay for a round-trip. Failures are never cached, so polling
+    picks up readiness as soon as it happens.
+    """
+    global _last_health
+    now = time.monotonic()
+    cached_url, cached_at, cached_ok = _last_health
+    if cached_ok and cached_url == keycloak_url and now - cached_at < _HEALTH_TTL:
+        return True
+    
+    session = _get_session()
+    from requests.exceptions import RequestException
+    
     try:
-        # Try to access the master realm - this is a reliable way to check if Keycloak is running
-        response = requests.get(f"{keycloak_url}/realms/master", timeout=10)
+        # Try to access the master realm - this is a reliable way to check if Keycloak is running.
+        # HEAD returns the same status without downloading the realm JSON.
+        realm_url = f"{keycloak_url}/realms/master"
+        response = session.head(realm_url, timeout=5, allow_redirects=False)
+        if response.status_code == 405:
+            # HEAD not allowed: fall back to GET, but close without reading the body
+            with session.get(realm_url, timeout=5, stream=True, allow_redirects=False) as response:
+                pass
         if response.status_code == 200:
             log("Keycloak health check passed", "SUCCESS")
+            _last_health = (keycloak_url, time.monotonic(), True)
             return True
         else:
             log(f"Keycloak health check failed with status {response.status_code}", "ERROR")
             return False
-    except requests.exceptions.RequestException as e:
+    except RequestException as e:
         log(f"Keycloak health check failed: {e}", "ERROR")
         return False
 
-def wait_for_keycloak(keycloak_url: str, max_attempts: int = 30) -> bool:
-    """Wait for Keycloak to become available."""
+def wait_for_keycloak(keycloak_url: str, timeout: float = 90.0) -> bool:
+    """Wait for Keycloak to become available, polling with exponential backoff."""
     log("Waiting for Keycloak to become available...")
     
-    for attempt in range(max_attempts):
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
         if check_keycloak_health(keycloak_url):
             return True
         
-        log(f"Attempt {attempt + 1}/{max_attempts} - Keycloak not ready yet...")
-        time.sleep(2)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        
+        attempt += 1
+        log(f"Attempt {attempt} - Keycloak not ready yet...")
+        # Start at 250ms and double up to 2s, with a little jitter
+        delay = min(2.0, 0.25 * (2 ** (attempt - 1))) + random.uniform(0, 0.1)
+        time.sleep(min(delay, remaining))
     
     log("Keycloak failed to become available within expected time", "ERROR")
     return False
 
-def manage_docker_compose(verbose: bool = False) -> bool:
-    """Manage Docker Compose for Keycloak."""
+def resolve_config_path(config_file: str) -> Path:
+    """Resolve a config path, treating relative paths as relative to the script's directory."""
+    config_path = Path(config_file)
+    if not config_path.is_absolute():
+        config_path = Path(__file__).parent / config_file
+    return config_path
+
+def compute_boot_fingerprint(config: Dict[str, Any]) -> str:
+    """Hash the inputs that determine what a booted Keycloak looks like.
+    
+    The already-parsed config is hashed in canonical form, so the config file
+    isn't read a second time and whitespace-only edits don't force a restart.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update((Path(__file__).parent / "docker-compose.yml").read_bytes())
+    return digest.hexdigest()
+
+def load_boot_state() -> Optional[Dict[str, Any]]:
+    """Load the state recorded by the last successful boot, if any."""
+    try:
+        with open(BOOT_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_boot_state(fingerprint: str) -> None:
+    """Record the fingerprint of a successful boot."""
+    try:
+        with open(BOOT_STATE_FILE, 'w') as f:
+            json.dump({"fingerprint": fingerprint, "timestamp": time.time()}, f)
+    except OSError as e:
+        log(f"Could not save boot state to {BOOT_STATE_FILE}: {e}", "WARNING")
+
+def start_containers_check() -> subprocess.Popen:
+    """Start checking for running Keycloak containers without waiting for the result.
+    
+    Pass the returned process to containers_running() to collect the answer.
+    """
+    # --quiet prints only container IDs, so any output means something is running
+    argv = ["docker", "compose", "ps", "--status", "running", "--quiet"]
+    log("Checking for existing Keycloak containers...")
+    log(f"Running: {' '.join(argv)}")
+    # stderr is kept separate so warnings aren't mistaken for container IDs
+    return subprocess.Popen(argv, cwd=Path(__file__).parent, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True)
+
+def containers_running(check: Optional[subprocess.Popen] = None) -> bool:
+    """Check whether any Keycloak containers are running."""
+    if check is None:
+        check = start_containers_check()
+    output, errors = check.communicate()
+    if logger.isEnabledFor(logging.DEBUG):
+        for line in (output + errors).splitlines():
+            logger.debug(line)
+    return check.returncode == 0 and bool(output.strip())
+
+def manage_docker_compose(keycloak_url: str = DEFAULT_KEYCLOAK_URL, fingerprint: Optional[str] = None,
+                          force: bool = False, running: Optional[bool] = None) -> bool:
+    """Manage Docker Compose for Keycloak.
+    
+    ``running`` may be passed in when the caller has already checked for running containers.
+    """
     # Use the script's directory as the working directory for Docker operations
     keycloak_dir = Path(__file__).parent
     
-    # Check if containers are running and stop them
-    log("Checking for existing Keycloak containers...")
-    result = run_command("docker compose ps", cwd=keycloak_dir, check=False, verbose=verbose)
+    if running is None:
+        running = containers_running()
     
-    if "Up" in result.stdout:
+    if running:
+        # Reuse a healthy running stack if it was booted from the same config and compose file
+        state = load_boot_state()
+        if force:
+            log("--force given, restarting Keycloak containers")
+        elif fingerprint is None or state is None or "fingerprint" not in state:
+            log("No recorded boot state for the running containers, restarting Keycloak containers")
+        elif state["fingerprint"] != fingerprint:
+            log("Configuration changed since last boot, restarting Keycloak containers")
+        elif check_keycloak_health(keycloak_url):
+            log("Keycloak containers already running with current configuration, skipping restart", "SUCCESS")
+            return True
+        else:
+            log("Running Keycloak stack is unhealthy, restarting Keycloak containers", "WARNING")
+        
         log("Stopping existing Keycloak containers...")
-        run_command("docker compose down", cwd=keycloak_dir, verbose=verbose)
+        run_command(["docker", "compose", "down"], cwd=keycloak_dir)
         time.sleep(2)  # Give containers time to stop
     
-    # Start fresh Keycloak
+    # Start fresh Keycloak and let Docker block until the container healthcheck passes
     log("Starting Keycloak with Docker Compose...")
-    result = run_command("docker compose up -d", cwd=keycloak_dir, verbose=verbose)
+    result = run_command(["docker", "compose", "up", "-d", "--wait", "--wait-timeout", str(COMPOSE_WAIT_TIMEOUT)],
+                         cwd=keycloak_dir, check=False)
     
     if result.returncode != 0:
-        log("Failed to start Keycloak containers", "ERROR")
+        log(f"Failed to start Keycloak containers (exit code {result.returncode})", "ERROR")
+        if result.stdout.strip():
+            log(f"Error: {result.stdout.strip()}", "ERROR")
         return False
     
     return True
 
-def run_setup_keycloak(config_file: str, keycloak_url: str, summary: bool = False, verbose: bool = False) -> bool:
-    """Run setup_keycloak.py script with the specified configuration."""
+def run_setup_keycloak(config_file: str, keycloak_url: str, summary: bool = False, verbose: bool = False,
+                       isolated: bool = False, batch: bool = False) -> bool:
+    """Run setup_keycloak.py with the specified configuration.
+    
+    By default the script's main() is called in this interpreter, avoiding a second
+    Python startup. Pass ``isolated=True`` to run it as a subprocess instead.
+    """
     try:
-        # Build command to run setup_keycloak.py
+        # Build arguments for setup_keycloak.py
         script_dir = Path(__file__).parent
         setup_script = script_dir / "setup_keycloak.py"
         
-        cmd = [
-            sys.executable, str(setup_script),
-            "--config", config_file,
+        setup_args = [
+            "--config", str(resolve_config_path(config_file)),
             "--url", keycloak_url
         ]
         
         if summary:
-            cmd.append("--summary")
+            setup_args.append("--summary")
         if verbose:
-            cmd.append("--verbose")
+            setup_args.append("--verbose")
+        if batch:
+            setup_args.append("--batch")
         
-        log(f"Running Keycloak setup: {' '.join(cmd)}")
-        
-        # Run the setup script
-        result = subprocess.run(
-            cmd,
-            cwd=script_dir,
-            check=True,
-            capture_output=False,  # Let output stream directly to console
-            text=True
-        )
+        if isolated:
+            cmd = [sys.executable, str(setup_script)] + setup_args
+            log(f"Running Keycloak setup: {' '.join(cmd)}")
+            
+            # Run the setup script, letting output stream directly to console
+            subprocess.run(cmd, cwd=script_dir, check=True)
+        else:
+            log(f"Running Keycloak setup in-process: {setup_script.name} {' '.join(setup_args)}")
+            
+            spec = importlib.util.spec_from_file_location("setup_keycloak", setup_script)
+            setup_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(setup_module)
+            
+            saved_argv = sys.argv
+            sys.argv = [setup_script.name] + setup_args
+            try:
+                setup_module.main()
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    log(f"Keycloak setup failed with exit code {e.code}", "ERROR")
+                    return False
+            finally:
+                sys.argv = saved_argv
         
         log("Keycloak setup completed successfully", "SUCCESS")
         return True
@@ -173,23 +360,70 @@ def run_setup_keycloak(config_file: str, keycloak_url: str, summary: bool = Fals
         log(f"Error running Keycloak setup: {e}", "ERROR")
         return False
 
+def _config_cache_path(config_path: Path) -> Path:
+    """Return the parsed-config cache file for the current version of config_path.
+    
+    Files are named <path hash>-<version hash>.pkl so stale versions of the same
+    config can be found and removed.
+    """
+    st = config_path.stat()
+    path_key = hashlib.sha1(str(config_path.resolve()).encode()).hexdigest()
+    version_key = hashlib.sha1(f"{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()[:16]
+    return CONFIG_CACHE_DIR / f"{path_key}-{version_key}.pkl"
+
+def _write_config_cache(cache_path: Path, config: Dict[str, Any]) -> None:
+    """Pickle config to cache_path, readable only by the current user.
+    
+    The config holds plaintext user passwords, so the cache directory is 0700 and
+    files are 0600. Older cached versions of the same config are removed.
+    """
+    cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    os.chmod(cache_path.parent, 0o700)
+    
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    
+    path_key = cache_path.name.split('-', 1)[0]
+    for stale in cache_path.parent.glob(f"{path_key}-*.pkl"):
+        if stale != cache_path:
+            stale.unlink()
+
 def load_config(config_file: str) -> Dict[str, Any]:
-    """Load configuration from JSON file."""
+    """Load configuration from JSON file, reusing a cached parse when the file is unchanged.
+    
+    Raises OSError if the file can't be read and ValueError if it isn't valid JSON.
+    """
+    # Handle both relative and absolute paths
+    config_path = resolve_config_path(config_file)
+    cache_path = _config_cache_path(config_path)
+    
+    config = None
     try:
-        # Handle both relative and absolute paths
-        config_path = Path(config_file)
-        if not config_path.is_absolute():
-            # If relative, try to find it relative to the script's directory
-            script_dir = Path(__file__).parent
-            config_path = script_dir / config_file
-            
+        with open(cache_path, 'rb') as f:
+            config = pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # pickle.load can raise almost anything on a corrupt file; treat it as a miss
+        log(f"Ignoring unreadable configuration cache {cache_path}: {e}", "WARNING")
+        try:
+            cache_path.unlink()
+        except OSError:
+            pass
+    
+    if config is None:
         with open(config_path, 'r') as f:
             config = json.load(f)
-        log(f"Configuration loaded from {config_path}", "SUCCESS")
-        return config
-    except Exception as e:
-        log(f"Failed to load configuration from {config_file}: {e}", "ERROR")
-        sys.exit(1)
+        try:
+            _write_config_cache(cache_path, config)
+        except OSError as e:
+            log(f"Could not cache parsed configuration: {e}", "WARNING")
+    
+    log(f"Configuration loaded from {config_path}", "SUCCESS")
+    return config
 
 def main():
     """Main function."""
@@ -198,8 +432,12 @@ def main():
     parser.add_argument("--url", default=DEFAULT_KEYCLOAK_URL, help="Keycloak URL")
     parser.add_argument("--summary", action="store_true", help="Show detailed summary")
     parser.add_argument("--verbose", action="store_true", help="Verbose output")
+    parser.add_argument("--force", action="store_true", help="Restart containers even if the running stack is up to date")
+    parser.add_argument("--isolated", action="store_true", help="Run setup_keycloak.py in a separate Python process")
+    parser.add_argument("--batch", action="store_true", help="Create users with a single partialImport request")
     
     args = parser.parse_args()
+    configure_logging(args.verbose)
     
     log("=== Boot Keycloak: Complete Setup and Configuration ===", "INFO")
     
@@ -211,24 +449,40 @@ def main():
             config_path = script_dir / DEFAULT_CONFIG_FILE
             args.config = str(config_path)
             
-        config = load_config(args.config)
-        realm_name = config['realm']['name']
+        # docker compose ps runs in the background while the config is loaded
+        containers_check = start_containers_check()
+        try:
+            try:
+                config = load_config(args.config)
+            except (OSError, ValueError) as e:
+                log(f"Failed to load configuration from {args.config}: {e}", "ERROR")
+                sys.exit(1)
+            realm_name = config['realm']['name']
+            fingerprint = compute_boot_fingerprint(config)
+            running = containers_running(containers_check)
+        finally:
+            # Kill and reap the probe if anything above failed before collecting it
+            if containers_check.returncode is None:
+                containers_check.kill()
+                containers_check.communicate()
         
         # Step 2: Manage Docker Compose
-        if not manage_docker_compose(args.verbose):
+        if not manage_docker_compose(args.url, fingerprint, args.force, running):
             log("Failed to manage Docker Compose", "ERROR")
             sys.exit(1)
         
-        # Step 3: Wait for Keycloak to be ready
-        if not wait_for_keycloak(args.url):
+        # Step 3: Sanity check that Keycloak is reachable (compose --wait already waited for health)
+        if not wait_for_keycloak(args.url, timeout=0):
             log("Keycloak failed to start", "ERROR")
             sys.exit(1)
         
         # Step 4: Run setup_keycloak.py to configure Keycloak
-        if not run_setup_keycloak(args.config, args.url, args.summary, args.verbose):
+        if not run_setup_keycloak(args.config, args.url, args.summary, args.verbose, args.isolated, args.batch):
             log("Failed to setup Keycloak configuration", "ERROR")
             sys.exit(1)
         
+        save_boot_state(fingerprint)
+        
         log("=== Boot Keycloak completed successfully! ===", "SUCCESS")
         log("Keycloak is ready for MCP integration")
         log(f"Keycloak URL: {args.url}")
@@ -44,6 +44,7 @@ class KeycloakSetup:
         self.admin_token = None
         self.session = requests.Session()
         self.debug = False
+        self.batch = False  # Create users with a single partialImport request
         self.admin_base_url = None  # Will be detected during setup
         
     def log(self, level: str, message: str):
@@ -692,6 +693,26 @@ class KeycloakSetup:
             self.log('ERROR', f'Failed to assign scope {scope_name} to client {client_id}: {e}')
             return False
             
+    def build_user_representation(self, user_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a Keycloak UserRepresentation from user configuration."""
+        user_data = {
+            "username": user_config['username'],
+            "email": user_config.get('email'),
+            "firstName": user_config.get('firstName'),
+            "lastName": user_config.get('lastName'),
+            "enabled": user_config.get('enabled', True),
+            "emailVerified": user_config.get('emailVerified', True)
+        }
+        
+        if 'password' in user_config:
+            user_data["credentials"] = [{
+                "type": "password",
+                "value": user_config['password'],
+                "temporary": user_config.get('temporary', False)
+            }]
+            
+        return user_data
+        
     def create_user(self, realm_name: str, user_config: Dict[str, Any]) -> bool:
         """Create a user."""
         username = user_config['username']
@@ -711,21 +732,7 @@ class KeycloakSetup:
                 return True
                 
             # Create user
-            user_data = {
-                "username": username,
-                "email": user_config.get('email'),
-                "firstName": user_config.get('firstName'),
-                "lastName": user_config.get('lastName'),
-                "enabled": user_config.get('enabled', True),
-                "emailVerified": user_config.get('emailVerified', True)
-            }
-            
-            if 'password' in user_config:
-                user_data["credentials"] = [{
-                    "type": "password",
-                    "value": user_config['password'],
-                    "temporary": user_config.get('temporary', False)
-                }]
+            user_data = self.build_user_representation(user_config)
                 
             response = self.session.post(
                 f"{self.admin_base_url}/realms/{realm_name}/users",
@@ -747,6 +754,44 @@ class KeycloakSetup:
             self.log('ERROR', f'Failed to create user {username}: {e}')
             return False
             
+    def import_users(self, realm_name: str, users_config: List[Dict[str, Any]]) -> bool:
+        """Create users and their client role mappings with a single partialImport request."""
+        self.log('INFO', f'Importing {len(users_config)} users via partial import...')
+        
+        users_data = []
+        for user_config in users_config:
+            user_data = self.build_user_representation(user_config)
+            if 'clientRoles' in user_config:
+                user_data["clientRoles"] = user_config['clientRoles']
+            users_data.append(user_data)
+            
+        import_data = {
+            "ifResourceExists": "SKIP",
+            "users": users_data
+        }
+        
+        if self.debug:
+            self.log('DEBUG', f'Partial import data: {json.dumps(import_data, indent=2)}')
+            
+        try:
+            response = self.session.post(
+                f"{self.admin_base_url}/realms/{realm_name}/partialImport",
+                json=import_data
+            )
+            response.raise_for_status()
+            
+            for result in response.json().get('results', []):
+                if result.get('action') == 'SKIPPED':
+                    self.log('WARNING', f"User {result.get('resourceName')} already exists, skipping creation")
+                else:
+                    self.log('SUCCESS', f"User {result.get('resourceName')} created")
+                    
+            return True
+            
+        except requests.exceptions.RequestException as e:
+            self.log('ERROR', f'Failed to import users: {e}')
+            return False
+            
     def get_user_uuid(self, realm_name: str, username: str) -> Optional[str]:
         """Get user UUID by username."""
         try:
@@ -1113,9 +1158,13 @@ class KeycloakSetup:
         
         # Step 6: Create users
         self.log('INFO', 'Creating users...')
-        for user in config.get('users', []):
-            if not self.create_user(realm_name, user):
+        if self.batch and config.get('users'):
+            if not self.import_users(realm_name, config['users']):
                 return False
+        else:
+            for user in config.get('users', []):
+                if not self.create_user(realm_name, user):
+                    return False
                 
         # Step 7: Set up authentication flows
         self.log('INFO', 'Setting up authentication flows...')
@@ -1271,6 +1320,7 @@ Examples:
     parser.add_argument('--test-commands', action='store_true', help='Print test commands')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--batch', action='store_true', help='Create users with a single partialImport request')
     
     args = parser.parse_args()
     
@@ -1283,6 +1333,10 @@ Examples:
     # Enable debug logging if requested
     if args.debug:
         setup.debug = True
+        
+    # Batch user creation if requested
+    if args.batch:
+        setup.batch = True
     
     # Get admin token
     if not setup.get_admin_token():
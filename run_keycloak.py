@@ -3,109 +3,123 @@
 Wrapper script to run boot_keycloak.py from the keycloak directory.
 This allows uv run keycloak to work from the project root.
 Defaults to using config.json at the project root.
+
+Arguments are passed straight through to boot_keycloak.py, which does the only
+argparse pass. This wrapper just rewrites the config path and handles --down.
 """
 
 import os
 import sys
-import argparse
-from pathlib import Path
+
+CONFIG_FLAGS = ("--config", "--configure")
+# Compose names the project after the directory holding docker-compose.yml
+COMPOSE_PROJECT = "keycloak"
+
+def compose_down_via_sdk() -> bool:
+    """Stop and remove the compose project's containers and networks with the Docker SDK.
+
+    Returns False if the SDK is not installed or the daemon can't be reached,
+    so the caller can fall back to the docker CLI.
+    """
+    try:
+        import docker
+    except ImportError:
+        return False
+
+    try:
+        client = docker.from_env()
+    except docker.errors.DockerException:
+        return False
+
+    project_filter = {"label": f"com.docker.compose.project={COMPOSE_PROJECT}"}
+    for container in client.containers.list(all=True, filters=project_filter):
+        container.stop(timeout=5)
+        container.remove()
+    for network in client.networks.list(filters=project_filter):
+        # Like docker compose down, leave networks other stacks (e.g. SPIRE) still use
+        network.reload()
+        if network.containers:
+            print(f"⚠️  Network {network.name} is still in use, not removing it")
+            continue
+        try:
+            network.remove()
+        except docker.errors.APIError as e:
+            print(f"⚠️  Could not remove network {network.name}: {e}")
+    return True
+
+def resolve_config_arg(config_arg: str, project_root: str) -> str:
+    """Resolve a user-supplied config path against the project root."""
+    if os.path.isabs(config_arg):
+        return config_arg
+    # Make it relative to project root, then convert to absolute
+    return os.path.realpath(os.path.join(project_root, config_arg))
 
 def main():
     # Get the project root directory (where this script is located)
-    project_root = Path(__file__).parent
-    keycloak_dir = project_root / "keycloak"
-    
-    # Parse arguments to handle config file path
-    parser = argparse.ArgumentParser(description="Boot and configure Keycloak", add_help=False)
-    parser.add_argument("--config", "--configure", default=None, help="Path to config file")
-    parser.add_argument("--url", default=None, help="Keycloak URL")
-    parser.add_argument("--summary", action="store_true", help="Show detailed summary")
-    parser.add_argument("--verbose", action="store_true", help="Verbose output")
-    parser.add_argument("--down", action="store_true", help="Stop Keycloak containers")
-    parser.add_argument("--help", "-h", action="store_true", help="Show help")
-    
-    # Parse known args to avoid errors with unrecognized arguments
-    args, unknown_args = parser.parse_known_args()
-    
-    # If help is requested, pass it through to boot_keycloak.py
-    if args.help:
-        os.chdir(keycloak_dir)
-        sys.path.insert(0, str(keycloak_dir))
-        from boot_keycloak import main as keycloak_main
-        sys.argv = ["boot_keycloak.py", "--help"]
-        keycloak_main()
-        return
-    
-    # If --down is requested, stop Keycloak containers
-    if args.down:
-        import subprocess
-        os.chdir(keycloak_dir)
-        
-        print("🔽 Stopping Keycloak containers...")
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    keycloak_dir = os.path.join(project_root, "keycloak")
+
+    args = sys.argv[1:]
+
+    # If --down is requested, stop Keycloak containers via the Docker API,
+    # or replace this process with docker compose down if the SDK isn't available
+    if "--down" in args:
+        print("🔽 Stopping Keycloak containers...", flush=True)
         try:
-            result = subprocess.run(
-                ["docker", "compose", "down"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            print("✅ Keycloak containers stopped successfully")
-            if args.verbose:
-                print(f"Command output: {result.stdout}")
-        except subprocess.CalledProcessError as e:
+            if compose_down_via_sdk():
+                print("✅ Keycloak containers stopped successfully")
+                return
+        except Exception as e:
             print(f"❌ Failed to stop Keycloak containers: {e}")
-            if e.stderr:
-                print(f"Error details: {e.stderr}")
             sys.exit(1)
-        except Exception as e:
-            print(f"❌ Unexpected error stopping Keycloak: {e}")
+
+        os.chdir(keycloak_dir)
+        try:
+            os.execvp("docker", ["docker", "compose", "down"])
+        except OSError as e:
+            print(f"❌ Failed to stop Keycloak containers: {e}")
             sys.exit(1)
-        return
-    
+
+    # Rebuild sys.argv for boot_keycloak.py, rewriting the config path
+    new_argv = ["boot_keycloak.py"]
+    config_path = None
+    i = 0
+    while i < len(args):
+        flag, has_value, value = args[i].partition("=")
+        if flag in CONFIG_FLAGS:
+            if not has_value:
+                if i + 1 >= len(args):
+                    # Let boot_keycloak.py report the missing value
+                    new_argv.append("--config")
+                    break
+                i += 1
+                value = args[i]
+            config_path = resolve_config_arg(value, project_root)
+        else:
+            new_argv.append(args[i])
+        i += 1
+
     # Default to config.json at project root if no config specified
-    if args.config is None:
-        default_config = project_root / "config.json"
-        if default_config.exists():
+    if config_path is None:
+        default_config = os.path.join(project_root, "config.json")
+        if os.path.exists(default_config):
             # Use absolute path to config.json at project root
-            config_path = str(default_config)
+            config_path = default_config
         else:
             # Fall back to keycloak/config.json (original behavior)
             config_path = "config.json"  # This will be relative to keycloak dir
-    else:
-        # User specified a config path
-        config_arg = Path(args.config)
-        if config_arg.is_absolute():
-            config_path = str(config_arg)
-        else:
-            # Make it relative to project root, then convert to absolute
-            config_path = str((project_root / config_arg).resolve())
-    
+
+    new_argv[1:1] = ["--config", config_path]
+
     # Change to the keycloak directory
     os.chdir(keycloak_dir)
-    
-    # Rebuild sys.argv for boot_keycloak.py
-    new_argv = ["boot_keycloak.py"]
-    
-    # Add the config argument
-    new_argv.extend(["--config", config_path])
-    
-    # Add other arguments
-    if args.url:
-        new_argv.extend(["--url", args.url])
-    if args.summary:
-        new_argv.append("--summary")
-    if args.verbose:
-        new_argv.append("--verbose")
-    
-    # Add any unknown arguments
-    new_argv.extend(unknown_args)
-    
+
     # Set sys.argv for boot_keycloak
     sys.argv = new_argv
-    
+
     # Import and run the main function from boot_keycloak
-    sys.path.insert(0, str(keycloak_dir))
-    
+    sys.path.insert(0, keycloak_dir)
+
     try:
         from boot_keycloak import main as keycloak_main
         keycloak_main()